@@ -35,22 +35,59 @@ Version: 1.0.0
 
 import logging
 import os
+import queue
+import re
+import socket
 import sys
+import threading
 import time
 import subprocess
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
 import requests
 from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 from urllib3.util.retry import Retry
 import cv2
 import numpy as np
 
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+except ImportError:
+    TurboJPEG = TJSAMP_420 = None
+
 # Module constants
 __version__ = "1.0.0"
 __author__ = "Richard van Liessum"
 __license__ = "MIT"
 
+# How long a resolved upload host address is reused before resolving again
+DNS_CACHE_TTL_SECONDS = 300
+
+# FFmpeg options for RTSP capture: TCP transport and no input buffering, so a
+# grabbed frame is as close to live as possible
+FFMPEG_CAPTURE_OPTIONS = 'rtsp_transport;tcp|fflags;nobuffer|flags;low_delay|max_delay;0'
+
+# Upper bound on time spent discarding frames queued by the capture backend
+RTSP_DRAIN_SECONDS = 0.05
+
+# Start-of-image marker every JPEG begins with
+JPEG_SOI = b'\xff\xd8'
+
+# Backoff between RTSP reconnect attempts, doubled after each failure
+RTSP_RECONNECT_BASE_SECONDS = 1.0
+RTSP_RECONNECT_MAX_SECONDS = 60.0
+
+# One line of a .env file: optional "export", KEY=value with the value
+# optionally quoted, and an optional trailing comment preceded by whitespace
+_ENV_RE = re.compile(
+    r'^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*'
+    r'(?:"([^"]*)"|\'([^\']*)\'|(.*?))'
+    r'(?:\s+#.*)?\s*$'
+)
+
 
 def load_dotenv(dotenv_path: Path = None) -> None:
     """
@@ -62,39 +99,116 @@ def load_dotenv(dotenv_path: Path = None) -> None:
     if dotenv_path is None:
         dotenv_path = Path.cwd() / '.env'
     
-    if not dotenv_path.exists():
-        return
-    
     try:
         with open(dotenv_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
+            for line in f:
+                # Empty lines, comments and malformed lines don't match
+                m = _ENV_RE.match(line)
+                if not m:
                     continue
                 
-                # Parse key=value pairs
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Remove surrounding quotes if present
-                    if value.startswith('"') and value.endswith('"'):
-                        value = value[1:-1]
-                    elif value.startswith("'") and value.endswith("'"):
-                        value = value[1:-1]
-                    
-                    # Only set if not already in environment (env vars take precedence)
-                    if key not in os.environ:
-                        os.environ[key] = value
+                key = m.group(1)
+                value = m.group(2) or m.group(3) or m.group(4) or ''
+                
+                # Only set if not already in environment (env vars take precedence)
+                if key not in os.environ:
+                    os.environ[key] = value
                         
+    except FileNotFoundError:
+        # A missing .env file is normal; configuration comes from the environment
+        return
     except Exception as e:
         # Don't fail if .env file has issues, just log and continue
         print(f"Warning: Failed to load .env file: {e}", file=sys.stderr)
 
 
+def _parse_bool(value: str) -> bool:
+    """Interpret an environment variable as a boolean flag."""
+    return value.lower() in ('1', 'true', 'yes')
+
+
+# Configuration fields as read from the environment: each field is set from the
+# upper-cased variable of the same name, falling back to the default, and
+# converted with the given function
+_CONFIG_SPEC: Dict[str, Tuple[Callable[[str], Any], str]] = {
+    'http_url': (str, 'https://webcam.connect.prusa3d.com/c/snapshot'),
+    'delay_seconds': (int, '10'),
+    'long_delay_seconds': (int, '60'),
+    'fingerprint': (str, '<fingerprint>'),
+    'token': (str, '<token>'),
+    'snapshot_url': (str, 'http://localhost:8080/?action=snapshot'),
+    'rtsp_url': (str, ''),
+    'ping_host': (str, 'prusa'),
+    'max_retries': (int, '3'),
+    'timeout': (int, '30'),
+    'rtsp_timeout': (int, '10'),
+    'capture_method': (str.lower, 'http'),  # 'http' or 'rtsp'
+    'save_snapshot': (_parse_bool, 'false'),
+    'connectivity_check': (str.lower, 'tcp'),  # 'tcp' or 'ping'
+    'pipeline_uploads': (_parse_bool, 'false'),
+    'jpeg_quality': (int, '75'),
+    'passthrough_jpeg': (_parse_bool, 'false'),
+}
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Uploader configuration, loaded once from the environment at startup.
+    
+    Fields are stored in slots and the instance is immutable, so the values
+    read on every loop iteration are plain attribute lookups.
+    """
+    __slots__ = tuple(_CONFIG_SPEC)
+    
+    http_url: str
+    delay_seconds: int
+    long_delay_seconds: int
+    fingerprint: str
+    token: str
+    snapshot_url: str
+    rtsp_url: str
+    ping_host: str
+    max_retries: int
+    timeout: int
+    rtsp_timeout: int
+    capture_method: str
+    save_snapshot: bool
+    connectivity_check: str
+    pipeline_uploads: bool
+    jpeg_quality: int
+    passthrough_jpeg: bool
+
+
+class LowLatencyHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter that tunes the sockets of its connection pools for small requests.
+
+    Snapshot GETs and upload PUTs are small, latency-bound requests, so Nagle's
+    algorithm is disabled (TCP_NODELAY) and TCP keep-alive is enabled to detect
+    dead pooled connections.
+    """
+
+    # Set TCP_NODELAY explicitly rather than relying on urllib3's defaults
+    SOCKET_OPTIONS = [
+        opt for opt in HTTPConnection.default_socket_options
+        if opt[:2] != (socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    ] + [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Create the pool manager with the tuned socket options."""
+        kwargs.setdefault('socket_options', self.SOCKET_OPTIONS)
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        """Create proxy managers with the tuned socket options."""
+        proxy_kwargs.setdefault('socket_options', self.SOCKET_OPTIONS)
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
 class PrusaWebcamUploader:
     """
     Handles webcam snapshot capture and upload to Prusa Connect.
@@ -111,38 +225,88 @@ class PrusaWebcamUploader:
         self.config = self._load_config()
         self.logger = self._setup_logging()
         self.session = self._setup_session()
+        self._apply_config()
         self.temp_image_path = Path("/tmp/prusa_output.jpg")
+        self._last_jpeg: Optional[Union[bytes, memoryview]] = None
+        self._rtsp_cap = None
+        self._rtsp_failures = 0
+        self._rtsp_retry_at = 0.0
         
-    def _load_config(self) -> dict:
-        """Load configuration from environment variables with validation."""
-        config = {
-            'http_url': os.getenv('HTTP_URL', 'https://webcam.connect.prusa3d.com/c/snapshot'),
-            'delay_seconds': int(os.getenv('DELAY_SECONDS', '10')),
-            'long_delay_seconds': int(os.getenv('LONG_DELAY_SECONDS', '60')),
-            'fingerprint': os.getenv('FINGERPRINT', '<fingerprint>'),
-            'token': os.getenv('TOKEN', '<token>'),
-            'snapshot_url': os.getenv('SNAPSHOT_URL', 'http://localhost:8080/?action=snapshot'),
-            'rtsp_url': os.getenv('RTSP_URL', ''),
-            'ping_host': os.getenv('PING_HOST', 'prusa'),
-            'max_retries': int(os.getenv('MAX_RETRIES', '3')),
-            'timeout': int(os.getenv('TIMEOUT', '30')),
-            'rtsp_timeout': int(os.getenv('RTSP_TIMEOUT', '10')),
-            'capture_method': os.getenv('CAPTURE_METHOD', 'http').lower(),  # 'http' or 'rtsp'
+    def _apply_config(self):
+        """
+        Derive the upload address, headers and encoder settings from ``self.config``.
+        
+        Called again whenever ``self.config`` is replaced, so nothing computed
+        from the old configuration is left behind.
+        """
+        self.upload_address = self._parse_upload_address()
+        self._upload_headers = {
+            'accept': '*/*',
+            'content-type': 'image/jpg',
+            'fingerprint': self.config.fingerprint,
+            'token': self.config.token,
         }
+        self._resolved_address: Optional[Tuple[str, int]] = None
+        self._resolved_expiry = 0.0
+        self._passthrough = self.config.passthrough_jpeg
+        self._tj = self._setup_turbojpeg()
+        self._jpeg_params = [
+            int(cv2.IMWRITE_JPEG_QUALITY), self.config.jpeg_quality,
+            int(cv2.IMWRITE_JPEG_OPTIMIZE), 1,
+            int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0,
+        ]
+        
+    def _load_config(self) -> Config:
+        """Load configuration from environment variables with validation."""
+        environ = os.environ
+        config = Config(**{
+            field: cast(environ.get(field.upper(), default))
+            for field, (cast, default) in _CONFIG_SPEC.items()
+        })
         
         # Validate required configuration
-        if config['fingerprint'] == '<fingerprint>' or config['token'] == '<token>':
+        if config.fingerprint == '<fingerprint>' or config.token == '<token>':
             raise ValueError("FINGERPRINT and TOKEN environment variables must be set")
         
         # Validate capture method configuration
-        if config['capture_method'] not in ['http', 'rtsp']:
+        if config.capture_method not in ['http', 'rtsp']:
             raise ValueError("CAPTURE_METHOD must be either 'http' or 'rtsp'")
         
-        if config['capture_method'] == 'rtsp' and not config['rtsp_url']:
+        if config.capture_method == 'rtsp' and not config.rtsp_url:
             raise ValueError("RTSP_URL must be set when CAPTURE_METHOD is 'rtsp'")
+        
+        # Validate connectivity check configuration
+        if config.connectivity_check not in ['tcp', 'ping']:
+            raise ValueError("CONNECTIVITY_CHECK must be either 'tcp' or 'ping'")
+        
+        # Validate JPEG encoder settings
+        if not 1 <= config.jpeg_quality <= 100:
+            raise ValueError("JPEG_QUALITY must be between 1 and 100")
+        
+        # Validate upload endpoint
+        upload_url = urlsplit(config.http_url)
+        if upload_url.scheme not in ['http', 'https'] or not upload_url.hostname:
+            raise ValueError("HTTP_URL must be an http:// or https:// URL")
             
         return config
     
+    def _parse_upload_address(self) -> Tuple[str, int]:
+        """
+        Parse the upload endpoint once into a (host, port) address.
+        
+        The upload URL is fixed for the lifetime of the process, so it is
+        parsed at startup instead of on every cycle.
+        
+        Returns:
+            Tuple[str, int]: Hostname and port of the Prusa Connect endpoint.
+        """
+        upload_url = urlsplit(self.config.http_url)
+        default_port = 443 if upload_url.scheme == 'https' else 80
+        # _load_config has already rejected upload URLs without a host
+        host = upload_url.hostname
+        assert host is not None
+        return host, upload_url.port or default_port
+    
     def _setup_logging(self) -> logging.Logger:
         """Set up structured logging with appropriate formatting."""
         logging.basicConfig(
@@ -160,25 +324,95 @@ class PrusaWebcamUploader:
         
         return logger
     
+    def _setup_turbojpeg(self):
+        """
+        Create a libjpeg-turbo encoder for RTSP frames, if available.
+        
+        Returns:
+            A ``TurboJPEG`` instance, or None to fall back to ``cv2.imencode``.
+        """
+        if self.config.capture_method != 'rtsp' or TurboJPEG is None:
+            return None
+        
+        try:
+            return TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            self.logger.debug("libjpeg-turbo not available, using OpenCV encoder: %s", e)
+            return None
+    
     def _setup_session(self) -> requests.Session:
         """Set up HTTP session with retry strategy and timeouts."""
         session = requests.Session()
         
         # Configure retry strategy
         retry_strategy = Retry(
-            total=self.config['max_retries'],
+            total=self.config.max_retries,
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504],
             allowed_methods=["HEAD", "GET", "PUT", "POST", "DELETE", "OPTIONS", "TRACE"]
         )
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Only the snapshot source and Prusa Connect are contacted, so a small
+        # non-blocking pool is enough to keep both connections alive for reuse
+        adapter = LowLatencyHTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            pool_block=False,
+            max_retries=retry_strategy
+        )
         session.mount("http://", adapter)
         session.mount("https://", adapter)
+        session.headers['Connection'] = 'keep-alive'
         
         return session
     
     def check_connectivity(self) -> bool:
+        """
+        Check if uploads can currently succeed.
+        
+        By default this opens (and immediately closes) a TCP connection to the
+        upload endpoint, which is far cheaper than spawning ``ping`` every cycle.
+        With CONNECTIVITY_CHECK=ping the printer is pinged via ICMP instead.
+        
+        Returns:
+            bool: True if the target is reachable, False otherwise.
+        """
+        if self.config.connectivity_check == 'ping':
+            return self._check_ping()
+        
+        try:
+            with socket.create_connection(self._resolve_upload_host(), timeout=2):
+                return True
+        except OSError as e:
+            # Resolve again next time in case the endpoint moved
+            self._resolved_address = None
+            # The caller warns that the endpoint is unreachable
+            self.logger.debug("TCP connectivity check failed: %s", e)
+            return False
+    
+    def _resolve_upload_host(self) -> Tuple[str, int]:
+        """
+        Resolve the upload host, reusing the result for DNS_CACHE_TTL_SECONDS.
+        
+        Returns:
+            Tuple[str, int]: IP address and port of the upload endpoint.
+            
+        Raises:
+            socket.gaierror: If the host cannot be resolved.
+        """
+        now = time.monotonic()
+        address = self._resolved_address
+        if address is None or now >= self._resolved_expiry:
+            host, port = self.upload_address
+            addrinfo = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP)
+            sockaddr = addrinfo[0][4]
+            address = (str(sockaddr[0]), int(sockaddr[1]))
+            self._resolved_address = address
+            self._resolved_expiry = now + DNS_CACHE_TTL_SECONDS
+        
+        return address
+    
+    def _check_ping(self) -> bool:
         """
         Check if the Prusa printer is reachable via ping.
         
@@ -187,7 +421,7 @@ class PrusaWebcamUploader:
         """
         try:
             result = subprocess.run(
-                ['ping', '-c', '1', self.config['ping_host']],
+                ['ping', '-c', '1', self.config.ping_host],
                 capture_output=True,
                 text=True,
                 timeout=10
@@ -204,7 +438,7 @@ class PrusaWebcamUploader:
         Returns:
             bool: True if snapshot was captured successfully, False otherwise.
         """
-        if self.config['capture_method'] == 'rtsp':
+        if self.config.capture_method == 'rtsp':
             return self._capture_from_rtsp()
         else:
             return self._capture_from_http()
@@ -217,27 +451,24 @@ class PrusaWebcamUploader:
             bool: True if snapshot was captured successfully, False otherwise.
         """
         try:
-            # Remove previous image if it exists
-            self.temp_image_path.unlink(missing_ok=True)
+            # Drop the previous snapshot
+            self._last_jpeg = None
             
             response = self.session.get(
-                self.config['snapshot_url'],
-                timeout=self.config['timeout'],
-                stream=True
+                self.config.snapshot_url,
+                timeout=self.config.timeout
             )
             response.raise_for_status()
             
-            # Save the image to temporary file
-            with open(self.temp_image_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Keep the image in memory until it is uploaded
+            data = response.content
             
-            # Verify the file was created and has content
-            if not self.temp_image_path.exists() or self.temp_image_path.stat().st_size == 0:
-                self.logger.error("Captured image is empty or doesn't exist")
+            if not data:
+                self.logger.error("Captured image is empty")
                 return False
-                
-            self.logger.debug(f"HTTP snapshot captured successfully: {self.temp_image_path.stat().st_size} bytes")
+            
+            self._store_snapshot(data)
+            self.logger.debug("HTTP snapshot captured successfully: %d bytes", len(data))
             return True
             
         except requests.RequestException as e:
@@ -251,99 +482,210 @@ class PrusaWebcamUploader:
         """
         Capture a snapshot from an RTSP stream using OpenCV.
         
+        The stream is kept open between snapshots; it is only reopened after
+        a read error, with exponential backoff between attempts.
+        
         Returns:
             bool: True if snapshot was captured successfully, False otherwise.
         """
-        cap = None
         try:
-            # Remove previous image if it exists
-            self.temp_image_path.unlink(missing_ok=True)
+            # Drop the previous snapshot
+            self._last_jpeg = None
             
-            # Create VideoCapture object for RTSP stream
-            cap = cv2.VideoCapture(self.config['rtsp_url'])
-            
-            # Set timeout for RTSP connection
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
-            if not cap.isOpened():
-                self.logger.error(f"Failed to open RTSP stream: {self.config['rtsp_url']}")
+            cap = self._ensure_rtsp()
+            if cap is None:
                 return False
             
             # Set a reasonable timeout for frame capture
             start_time = time.time()
-            timeout = self.config['rtsp_timeout']
+            timeout = self.config.rtsp_timeout
+            
+            # Skip stale buffered frames and decode only the newest one
+            if not self._grab_latest_frame(cap):
+                self.logger.error("Failed to read frame from RTSP stream")
+                self._rtsp_failed()
+                return False
             
-            # Try to read a frame
-            ret, frame = cap.read()
+            ret, frame = cap.retrieve()
             
             if not ret or frame is None:
                 self.logger.error("Failed to read frame from RTSP stream")
+                self._rtsp_failed()
                 return False
             
+            self._rtsp_failures = 0
+            
             # Check if we got a valid frame within timeout
             if time.time() - start_time > timeout:
                 self.logger.error(f"RTSP frame capture timed out after {timeout} seconds")
                 return False
             
-            # Encode frame as JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]  # 85% quality
-            success, encoded_img = cv2.imencode('.jpg', frame, encode_param)
-            
-            if not success:
-                self.logger.error("Failed to encode RTSP frame as JPEG")
-                return False
-            
-            # Save the encoded image
-            with open(self.temp_image_path, 'wb') as f:
-                f.write(encoded_img.tobytes())
+            # MJPEG packets are already JPEGs; anything else has to be encoded,
+            # preferring libjpeg-turbo's SIMD encoder
+            if self._passthrough:
+                data = memoryview(frame).cast('B')
+                
+                if data[:2] != JPEG_SOI:
+                    self.logger.warning("RTSP stream is not MJPEG, re-encoding frames instead")
+                    self._passthrough = False
+                    self._release_rtsp()
+                    return False
+            elif self._tj is not None:
+                data = self._tj.encode(
+                    frame, quality=self.config.jpeg_quality, jpeg_subsample=TJSAMP_420
+                )
+            else:
+                # Baseline JPEG with optimized Huffman tables; OpenCV uses 4:2:0
+                success, encoded_img = cv2.imencode('.jpg', frame, self._jpeg_params)
+                
+                if not success:
+                    self.logger.error("Failed to encode RTSP frame as JPEG")
+                    return False
+                
+                # Upload straight from the encoder's buffer instead of copying it
+                data = encoded_img.data
             
-            # Verify the file was created and has content
-            if not self.temp_image_path.exists() or self.temp_image_path.stat().st_size == 0:
-                self.logger.error("Captured RTSP image is empty or doesn't exist")
+            if not data:
+                self.logger.error("Captured RTSP image is empty")
                 return False
             
-            self.logger.debug(f"RTSP snapshot captured successfully: {self.temp_image_path.stat().st_size} bytes")
+            self._store_snapshot(data)
+            self.logger.debug("RTSP snapshot captured successfully: %d bytes", len(data))
             return True
             
         except cv2.error as e:
             self.logger.error(f"OpenCV error during RTSP capture: {e}")
+            self._rtsp_failed()
             return False
         except Exception as e:
             self.logger.error(f"Failed to capture RTSP snapshot: {e}")
+            self._rtsp_failed()
             return False
-        finally:
-            if cap is not None:
-                cap.release()
     
-    def upload_snapshot(self) -> bool:
+    def _ensure_rtsp(self):
         """
-        Upload the captured snapshot to Prusa Connect.
+        Return the open RTSP capture, connecting first if necessary.
+        
+        Returns:
+            The opened ``cv2.VideoCapture``, or None if the stream could not
+            be opened or a reconnect is still backing off.
+        """
+        if self._rtsp_cap is not None:
+            return self._rtsp_cap
+        
+        if time.monotonic() < self._rtsp_retry_at:
+            self.logger.warning("RTSP reconnect backing off after previous failure")
+            return None
+        
+        # Create VideoCapture object for RTSP stream using the FFmpeg backend;
+        # OPENCV_FFMPEG_CAPTURE_OPTIONS can still be overridden by the user
+        os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', FFMPEG_CAPTURE_OPTIONS)
+        cap = cv2.VideoCapture(self.config.rtsp_url, cv2.CAP_FFMPEG)
+        self._rtsp_cap = cap
+        
+        # Keep as few frames as possible queued in the backend
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        
+        if not cap.isOpened():
+            self.logger.error(f"Failed to open RTSP stream: {self.config.rtsp_url}")
+            self._rtsp_failed()
+            return None
+        
+        # Ask FFmpeg for the undecoded packets so MJPEG frames can be uploaded as-is
+        if self._passthrough and not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            self.logger.warning("RTSP backend cannot return raw packets, re-encoding frames instead")
+            self._passthrough = False
+        
+        self.logger.info(f"Connected to RTSP stream: {self.config.rtsp_url}")
+        return cap
+    
+    def _rtsp_failed(self):
+        """Drop the RTSP capture and schedule the next reconnect attempt."""
+        self._release_rtsp()
+        self._rtsp_failures += 1
+        backoff = min(
+            RTSP_RECONNECT_BASE_SECONDS * 2 ** (self._rtsp_failures - 1),
+            RTSP_RECONNECT_MAX_SECONDS
+        )
+        self._rtsp_retry_at = time.monotonic() + backoff
+    
+    def _release_rtsp(self):
+        """Release the RTSP capture if one is open."""
+        cap, self._rtsp_cap = self._rtsp_cap, None
+        if cap is not None:
+            cap.release()
+    
+    def _grab_latest_frame(self, cap) -> bool:
+        """
+        Grab frames until the backend's queue is drained.
+        
+        ``grab()`` returns queued frames immediately and only blocks once it
+        has caught up with the live stream, so grabbing for a short window
+        leaves the newest frame ready for ``retrieve()``.
+        
+        Args:
+            cap: An opened ``cv2.VideoCapture``.
+            
+        Returns:
+            bool: True if at least one frame was grabbed, False otherwise.
+        """
+        grabbed = False
+        deadline = time.monotonic() + RTSP_DRAIN_SECONDS
+        
+        while cap.grab():
+            grabbed = True
+            if time.monotonic() >= deadline:
+                break
+        
+        return grabbed
+    
+    def _store_snapshot(self, data: Union[bytes, memoryview]) -> None:
+        """
+        Keep a captured JPEG in memory for the next upload.
+        
+        The image is only written to ``temp_image_path`` when SAVE_SNAPSHOT is
+        enabled, which is useful for debugging the capture source.
+        
+        Args:
+            data: Encoded JPEG bytes, or a byte view of the encoder output.
+            
+        Raises:
+            IOError: If SAVE_SNAPSHOT is enabled and the file cannot be written.
+        """
+        if self.config.save_snapshot:
+            with open(self.temp_image_path, 'wb') as f:
+                f.write(data)
+        
+        self._last_jpeg = data
+    
+    def upload_snapshot(self, jpeg: Optional[Union[bytes, memoryview]] = None) -> bool:
+        """
+        Upload a snapshot to Prusa Connect.
+        
+        Args:
+            jpeg: Encoded JPEG to upload. Defaults to the last captured snapshot.
         
         Returns:
             bool: True if upload was successful, False otherwise.
         """
-        if not self.temp_image_path.exists():
-            self.logger.error("No snapshot file to upload")
+        if jpeg is None:
+            jpeg = self._last_jpeg
+        
+        if jpeg is None:
+            self.logger.error("No snapshot to upload")
             return False
             
         try:
-            headers = {
-                'accept': '*/*',
-                'content-type': 'image/jpg',
-                'fingerprint': self.config['fingerprint'],
-                'token': self.config['token'],
-            }
-            
-            with open(self.temp_image_path, 'rb') as f:
-                response = self.session.put(
-                    self.config['http_url'],
-                    headers=headers,
-                    data=f,
-                    timeout=self.config['timeout']
-                )
+            # Send the JPEG as a single buffer; requests derives Content-Length from it
+            response = self.session.put(
+                self.config.http_url,
+                headers=self._upload_headers,
+                data=jpeg,
+                timeout=self.config.timeout
+            )
             
             response.raise_for_status()
-            self.logger.info(f"Snapshot uploaded successfully (Status: {response.status_code})")
+            self.logger.info("Snapshot uploaded successfully (Status: %s)", response.status_code)
             return True
             
         except requests.RequestException as e:
@@ -352,12 +694,14 @@ class PrusaWebcamUploader:
                 self.logger.error(f"Response status: {e.response.status_code}")
                 self.logger.error(f"Response content: {e.response.text}")
             return False
-        except IOError as e:
-            self.logger.error(f"Failed to read snapshot file: {e}")
-            return False
     
     def cleanup(self):
-        """Clean up temporary files."""
+        """Release the in-memory snapshot, the RTSP stream and temporary files."""
+        self._last_jpeg = None
+        try:
+            self._release_rtsp()
+        except Exception as e:
+            self.logger.warning(f"Failed to release RTSP stream: {e}")
         try:
             self.temp_image_path.unlink(missing_ok=True)
             self.logger.debug("Cleanup completed")
@@ -378,55 +722,168 @@ class PrusaWebcamUploader:
         if env_file.exists():
             self.logger.info(f"Loaded configuration from .env file: {env_file}")
         
-        self.logger.info(f"Upload URL: {self.config['http_url']}")
-        self.logger.info(f"Capture method: {self.config['capture_method'].upper()}")
+        self.logger.info(f"Upload URL: {self.config.http_url}")
+        self.logger.info(f"Capture method: {self.config.capture_method.upper()}")
         
-        if self.config['capture_method'] == 'rtsp':
-            self.logger.info(f"RTSP URL: {self.config['rtsp_url']}")
-            self.logger.info(f"RTSP timeout: {self.config['rtsp_timeout']}s")
+        if self.config.capture_method == 'rtsp':
+            self.logger.info(f"RTSP URL: {self.config.rtsp_url}")
+            self.logger.info(f"RTSP timeout: {self.config.rtsp_timeout}s")
         else:
-            self.logger.info(f"Snapshot URL: {self.config['snapshot_url']}")
+            self.logger.info(f"Snapshot URL: {self.config.snapshot_url}")
+        
+        if self.config.save_snapshot:
+            self.logger.info(f"Saving snapshots to: {self.temp_image_path}")
+        
+        if self.config.pipeline_uploads:
+            self.logger.info("Pipelined uploads enabled")
             
-        self.logger.info(f"Normal delay: {self.config['delay_seconds']}s")
-        self.logger.info(f"Error delay: {self.config['long_delay_seconds']}s")
+        self.logger.info(f"Normal delay: {self.config.delay_seconds}s")
+        self.logger.info(f"Error delay: {self.config.long_delay_seconds}s")
+        
+        if self.config.connectivity_check == 'ping':
+            unreachable_message = f"Printer not reachable at {self.config.ping_host}"
+        else:
+            host, port = self.upload_address
+            unreachable_message = f"Upload endpoint not reachable at {host}:{port}"
         
-        delay = self.config['delay_seconds']
+        delay = self.config.delay_seconds
         
         try:
+            if self.config.pipeline_uploads:
+                self._run_pipelined(unreachable_message)
+                return
+            
             while True:
+                # Delays are measured from the start of each cycle, so time
+                # spent capturing and uploading doesn't stretch the cadence
+                cycle_start = time.monotonic()
                 try:
                     # Check connectivity first
                     if not self.check_connectivity():
-                        self.logger.warning(f"Printer not reachable at {self.config['ping_host']}")
-                        time.sleep(delay)
+                        self.logger.warning(unreachable_message)
+                        time.sleep(max(0.0, cycle_start + delay - time.monotonic()))
                         continue
                     
                     # Capture snapshot
                     if self.capture_snapshot():
                         # Upload snapshot
                         if self.upload_snapshot():
-                            delay = self.config['delay_seconds']
-                            self.logger.debug(f"Next upload in {delay} seconds")
+                            delay = self.config.delay_seconds
+                            self.logger.debug("Next upload in %s seconds", delay)
                         else:
-                            delay = self.config['long_delay_seconds']
+                            delay = self.config.long_delay_seconds
                             self.logger.warning(f"Upload failed, retrying in {delay} seconds")
                     else:
-                        delay = self.config['long_delay_seconds']
+                        delay = self.config.long_delay_seconds
                         self.logger.warning(f"Snapshot capture failed, retrying in {delay} seconds")
                     
-                    time.sleep(delay)
+                    time.sleep(max(0.0, cycle_start + delay - time.monotonic()))
                     
                 except KeyboardInterrupt:
                     self.logger.info("Received interrupt signal, shutting down...")
                     break
                 except Exception as e:
                     self.logger.error(f"Unexpected error in main loop: {e}", exc_info=True)
-                    delay = self.config['long_delay_seconds']
+                    delay = self.config.long_delay_seconds
                     time.sleep(delay)
                     
         finally:
             self.cleanup()
             self.logger.info("Prusa Connect Webcam Uploader stopped")
+    
+    def _run_pipelined(self, unreachable_message: str):
+        """
+        Run capture and upload concurrently.
+        
+        A background thread captures snapshots on the normal schedule while
+        this thread uploads them, so a slow upload doesn't delay the next
+        capture. Only the newest snapshot is kept; one that is still waiting
+        when the next is captured is dropped. After a failed upload this
+        thread backs off for LONG_DELAY_SECONDS, as the sequential loop does.
+        
+        Args:
+            unreachable_message: Warning logged when the connectivity check fails.
+        """
+        frames: "queue.Queue[Union[bytes, memoryview]]" = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._capture_worker,
+            args=(frames, stop, unreachable_message),
+            name="snapshot-capture",
+            daemon=True
+        )
+        producer.start()
+        
+        try:
+            while producer.is_alive():
+                try:
+                    jpeg = frames.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                
+                if not self.upload_snapshot(jpeg):
+                    delay = self.config.long_delay_seconds
+                    self.logger.warning(f"Upload failed, retrying in {delay} seconds")
+                    time.sleep(delay)
+                    
+        except KeyboardInterrupt:
+            self.logger.info("Received interrupt signal, shutting down...")
+        finally:
+            stop.set()
+            # Wait out a capture in progress; run() releases the stream and
+            # snapshot the producer is using as soon as this returns
+            producer.join()
+    
+    def _capture_worker(self, frames: queue.Queue, stop: threading.Event,
+                        unreachable_message: str):
+        """
+        Capture snapshots into ``frames`` until ``stop`` is set.
+        
+        Args:
+            frames: Single-slot queue handed to the uploading thread.
+            stop: Event that ends the loop.
+            unreachable_message: Warning logged when the connectivity check fails.
+        """
+        delay = self.config.delay_seconds
+        
+        while not stop.is_set():
+            cycle_start = time.monotonic()
+            try:
+                if not self.check_connectivity():
+                    self.logger.warning(unreachable_message)
+                elif self.capture_snapshot():
+                    jpeg = self._last_jpeg
+                    if jpeg is not None:
+                        self._offer_frame(frames, jpeg)
+                    delay = self.config.delay_seconds
+                    self.logger.debug("Next capture in %s seconds", delay)
+                else:
+                    delay = self.config.long_delay_seconds
+                    self.logger.warning(f"Snapshot capture failed, retrying in {delay} seconds")
+            except Exception as e:
+                self.logger.error(f"Unexpected error in capture loop: {e}", exc_info=True)
+                delay = self.config.long_delay_seconds
+            
+            stop.wait(max(0.0, cycle_start + delay - time.monotonic()))
+    
+    @staticmethod
+    def _offer_frame(frames: queue.Queue, jpeg: Union[bytes, memoryview]):
+        """
+        Put a snapshot on the queue, replacing one that hasn't been uploaded yet.
+        
+        Args:
+            frames: Single-slot snapshot queue.
+            jpeg: Encoded JPEG to queue.
+        """
+        while True:
+            try:
+                frames.put_nowait(jpeg)
+                return
+            except queue.Full:
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
 
 
 def main():
@@ -10,16 +10,31 @@ This script provides a comprehensive testing solution that combines:
 
 Usage:
     python run_tests.py                    # Run all checks
-    python run_tests.py --quick           # Skip slow tests
-    python run_tests.py --coverage        # Generate coverage report
+    python run_tests.py --quick           # Skip slow tests, last failures first
+    python run_tests.py --coverage        # Show a coverage report
+    python run_tests.py --coverage-html   # Also write an HTML coverage report
     python run_tests.py --lint-only       # Only run linting
+    python run_tests.py -j 4              # Run tests on 4 worker processes
+    python run_tests.py --quick --watch   # Re-run quick tests on every change
     python run_tests.py --help           # Show all options
 """
 
+import copy
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import shlex
+import shutil
 import subprocess
 import sys
+import threading
+import time
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -35,187 +50,619 @@ class Colors:
     NC = '\033[0m'  # No Color
 
 
+@lru_cache(maxsize=None)
+def project_layout_error(project_root, main_module):
+    """
+    Check that the project files the runner needs are present.
+    
+    The layout doesn't change while the runner is going, so the result is
+    memoised per project root and module.
+    
+    Returns:
+        A description of the first missing file, or None if all are present
+    """
+    if not (project_root / f"{main_module}.py").exists():
+        return f"Main module {main_module}.py not found"
+    if not (project_root / "tests").exists():
+        return "Tests directory not found"
+    return None
+
+
 class TestRunner:
     """Unified test runner with comprehensive checks."""
     
-    def __init__(self, verbose=False):
+    # Serialises live output from checks running on different threads
+    _output_lock = threading.Lock()
+    
+    # pytest plugins the suite needs, by the package providing each. Test runs
+    # turn off plugin autoloading, which scans every installed package's
+    # metadata on startup, and load these with -p instead.
+    PYTEST_PLUGINS = {
+        "xdist": "xdist.plugin",
+        "pytest_cov": "pytest_cov.plugin",
+        "pytest_timeout": "pytest_timeout",
+        "pyfakefs": "pyfakefs.pytest_plugin",
+    }
+    
+    # pytest arguments for each option of a test run, in command line order
+    PYTEST_FLAGS = {
+        # With failures on record, --last-failed also skips collecting test
+        # files that have none
+        "last_failed": ["--lf", "--ff", "-x"],
+        # Local runs don't write .pytest_cache, except for --last-failed
+        "no_cache": ["-p", "no:cacheprovider"],
+        "quick": ["-m", "not slow"],
+        "coverage": ["--cov=prusa_webcam_uploader", "--cov-report=term-missing"],
+        # A subset of the suite can't meet the floor, so only full runs enforce it
+        "coverage_floor": ["--cov-fail-under=85"],
+        "coverage_html": ["--cov-report=html"],
+        # CI only needs pass/fail, so skip the header, summary and long tracebacks
+        "ci": ["--no-header", "--no-summary", "-q", "--tb=line"],
+        "verbose": ["-v"],
+    }
+    
+    # Passing checks are trusted for a week, so tool upgrades get picked up
+    CHECK_MARKER_MAX_AGE = 7 * 24 * 60 * 60
+    
+    def __init__(self, verbose=False, workers="auto", perf_workers="1", max_workers=None,
+                 use_cache=True, ci=False):
         self.verbose = verbose
+        self.ci = ci
+        self.workers = workers
+        self.perf_workers = perf_workers
+        self.max_workers = max_workers
+        self.use_cache = use_cache
         self.project_root = Path(__file__).parent
         self.main_module = "prusa_webcam_uploader"
+        # Markers for checks that passed against an unchanged main module
+        self.check_cache = self.project_root / ".cache" / "test_runner"
+        self.stream = sys.stdout
+        self.label = ""
+        self.cpus = None
         
     def print_status(self, message, color=Colors.BLUE):
         """Print status message with color."""
-        print(f"{color}[INFO]{Colors.NC} {message}")
+        self.stream.write(f"{color}[INFO]{Colors.NC} {message}\n")
         
     def print_success(self, message):
         """Print success message."""
-        print(f"{Colors.GREEN}[SUCCESS]{Colors.NC} {message}")
+        self.stream.write(f"{Colors.GREEN}[SUCCESS]{Colors.NC} {message}\n")
         
     def print_warning(self, message):
         """Print warning message."""
-        print(f"{Colors.YELLOW}[WARNING]{Colors.NC} {message}")
+        self.stream.write(f"{Colors.YELLOW}[WARNING]{Colors.NC} {message}\n")
         
     def print_error(self, message):
         """Print error message."""
-        print(f"{Colors.RED}[ERROR]{Colors.NC} {message}")
+        self.stream.write(f"{Colors.RED}[ERROR]{Colors.NC} {message}\n")
+        
+    def check_marker(self, argv):
+        """
+        Marker file recording that ``argv`` passed on the current main module.
+        
+        The name is the tool followed by a digest of the command and the
+        module's contents, so editing the file or changing the command
+        invalidates it while touching the file without changes does not.
+        """
+        digest = hashlib.blake2b(shlex.join(argv).encode(), digest_size=16)
+        digest.update((self.project_root / f"{self.main_module}.py").read_bytes())
+        return self.check_cache / f"{Path(argv[0]).name}_ok_{digest.hexdigest()}"
+        
+    def marker_is_fresh(self, marker):
+        """Whether ``marker`` exists and is recent enough to be trusted."""
+        try:
+            age = time.time() - marker.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if age > self.CHECK_MARKER_MAX_AGE:
+            marker.unlink(missing_ok=True)
+            return False
+        return True
+        
+    def run_cached_command(self, argv, description, required=True, entry_point=None,
+                           summarize=None):
+        """
+        Run a check on the main module, skipping it if it already passed unchanged.
+        
+        If the tool's Python API is given as ``entry_point``, it is called in
+        this process instead, as long as paths in ``argv`` resolve the same way.
+        ``summarize`` is passed on to run_command.
+        """
+        marker = self.check_marker(argv)
+        if self.use_cache and self.marker_is_fresh(marker):
+            self.print_success(f"{description} skipped (unchanged since last pass)")
+            return True
+        
+        if entry_point is not None and Path.cwd() == self.project_root.resolve():
+            return self.run_entry_point(entry_point, argv, description, required, marker)
+        
+        # Static checks only read the source, so don't leave .pyc files behind
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+        return self.run_command(
+            argv, description, required, marker=marker, env=env, rerun_on_failure=True,
+            summarize=summarize
+        )
         
-    def run_command(self, command, description, required=True):
-        """Run a command and handle results."""
+    def echo(self, line):
+        """Write a line of live command output, labelled when checks run concurrently."""
+        with self._output_lock:
+            sys.stdout.write(f"{self.label}{line}")
+            sys.stdout.flush()
+        
+    def spawnable(self, argv):
+        """
+        ``argv`` with the program resolved to a path, as posix_spawn requires.
+        
+        If the runner has been given cores, the command runs under taskset
+        so it stays on them.
+        """
+        executable = shutil.which(argv[0])
+        if executable is None:
+            return argv
+        if self.cpus:
+            cpu_list = ",".join(map(str, sorted(self.cpus)))
+            return [shutil.which("taskset"), "-c", cpu_list, executable, *argv[1:]]
+        return [executable, *argv[1:]]
+        
+    def spawn_options(self):
+        """
+        Popen options that let subprocess start children with posix_spawn.
+        
+        posix_spawn avoids copying this process's page tables for each child,
+        but subprocess only uses it without close_fds or cwd. Leaving
+        close_fds off is safe because Popen's own pipes are never inherited
+        (PEP 446), and cwd is only passed when it isn't already the project.
+        """
+        if Path.cwd() == self.project_root.resolve():
+            return {"close_fds": False}
+        return {"close_fds": False, "cwd": self.project_root}
+        
+    def run_command(self, argv, description, required=True, marker=None, env=None,
+                    rerun_on_failure=False, summarize=None):
+        """
+        Run a command and handle results.
+        
+        The command is executed directly from its argument list, without a
+        shell. In verbose mode its output is echoed line by line as it runs;
+        otherwise the output of required commands is kept and shown only if
+        they fail. If ``marker`` is given, it is created when the command
+        succeeds.
+        
+        Output that will never be shown goes straight to /dev/null. With
+        ``rerun_on_failure``, a quiet required command does the same, and is
+        run a second time to collect its output only if it fails; use it for
+        checks that are cheap to repeat.
+        
+        For commands with machine-readable output, ``summarize`` turns the
+        output lines into the lines to show, which are then shown instead of
+        the raw output, including in verbose mode.
+        """
         self.print_status(f"{description}...")
         
+        discard = not self.verbose and (not required or rerun_on_failure)
         try:
-            result = subprocess.run(
-                command, 
-                shell=True, 
-                check=True, 
-                capture_output=True, 
+            proc = subprocess.Popen(
+                self.spawnable(argv),
+                stdout=subprocess.DEVNULL if discard else subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                env=env,
+                **self.spawn_options()
+            )
+        except FileNotFoundError:
+            if required:
+                self.print_error(f"{description} failed: {argv[0]} not found")
+                return False
+            self.print_warning(f"{description} skipped: {argv[0]} not found")
+            return True
+        
+        keep_output = (required and not self.verbose) or summarize is not None
+        output = []
+        with proc:
+            if not discard:
+                for line in proc.stdout:
+                    if self.verbose and summarize is None:
+                        self.echo(line)
+                    elif keep_output:
+                        output.append(line)
+        
+        if discard and required and proc.returncode != 0:
+            rerun = subprocess.run(
+                self.spawnable(argv),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 text=True,
-                cwd=self.project_root
+                env=env,
+                **self.spawn_options()
             )
+            output = rerun.stdout.splitlines(keepends=True)
+        
+        if summarize is not None and output:
+            output = summarize(output)
+            if self.verbose:
+                for line in output:
+                    self.echo(line)
+                output = []
+        
+        return self.report_result(description, proc.returncode, output, required, marker)
+        
+    def run_entry_point(self, entry_point, argv, description, required=True, marker=None):
+        """
+        Run a tool through its Python API instead of starting a new interpreter.
+        
+        Args:
+            entry_point: Callable taking the tool's arguments (``argv`` without
+                the program name) and returning ``(stdout, stderr, exit_status)``
+            argv: Command line the tool would be run with
+            description: Name of the check for status messages
+            required: Whether failure fails the whole run
+            marker: File to create when the tool succeeds
+        """
+        self.print_status(f"{description}...")
+        
+        stdout, stderr, returncode = entry_point(argv[1:])
+        output = (stdout + stderr).splitlines(keepends=True)
+        if self.verbose:
+            for line in output:
+                self.echo(line)
+            output = []
             
-            if self.verbose and result.stdout:
-                print(result.stdout)
+        return self.report_result(description, returncode, output, required, marker)
+        
+    def report_result(self, description, returncode, output, required, marker=None):
+        """Report how a check finished and return False if it fails the run."""
+        if returncode == 0:
+            if marker is not None:
+                marker.parent.mkdir(parents=True, exist_ok=True)
+                marker.touch()
                 
             self.print_success(f"{description} completed")
             return True
-            
-        except subprocess.CalledProcessError as e:
-            if required:
-                self.print_error(f"{description} failed")
-                if e.stdout:
-                    print("STDOUT:", e.stdout)
-                if e.stderr:
-                    print("STDERR:", e.stderr)
-                return False
-            else:
-                self.print_warning(f"{description} had issues (non-critical)")
-                if self.verbose and e.stderr:
-                    print("STDERR:", e.stderr)
-                return True
+        
+        if required:
+            self.print_error(f"{description} failed")
+            if output:
+                self.stream.write(f"OUTPUT: {''.join(output)}\n")
+            return False
+        
+        self.print_warning(f"{description} had issues (non-critical)")
+        return True
                 
     def check_dependencies(self):
         """Check if required dependencies are available."""
         self.print_status("Checking dependencies...")
         
-        # Check if main module exists
-        if not (self.project_root / f"{self.main_module}.py").exists():
-            self.print_error(f"Main module {self.main_module}.py not found")
-            return False
-            
-        # Check if test directory exists
-        if not (self.project_root / "tests").exists():
-            self.print_error("Tests directory not found")
+        error = project_layout_error(self.project_root, self.main_module)
+        if error:
+            self.print_error(error)
             return False
             
         return True
         
+    def summarize_ruff(self, output):
+        """
+        Condense ``ruff check --output-format=json`` output to one line per rule.
+        
+        Each line shows the rule's first violation and how many more there
+        are. Output that isn't JSON, such as an error from ruff itself, is
+        returned unchanged.
+        """
+        try:
+            violations = json.loads("".join(output))
+        except ValueError:
+            return output
+            
+        by_rule = {}
+        for violation in violations:
+            by_rule.setdefault(violation["code"], []).append(violation)
+            
+        lines = []
+        for rule, found in by_rule.items():
+            first = found[0]
+            path = os.path.relpath(first["filename"], self.project_root)
+            location = f"{path}:{first['location']['row']}:{first['location']['column']}"
+            more = f" (+{len(found) - 1} more)" if len(found) > 1 else ""
+            lines.append(f"{location}: {rule or 'error'} {first['message']}{more}\n")
+        return lines
+        
     def run_linting(self):
-        """Run code linting with flake8."""
-        cmd = f"flake8 {self.main_module}.py --max-line-length=100 --ignore=E501,W503,E203"
-        return self.run_command(cmd, "Code linting (flake8)")
+        """Run code linting with ruff, or with flake8 if ruff isn't installed."""
+        if shutil.which("ruff"):
+            # The pycodestyle and pyflakes rules flake8 checks by default;
+            # W503 and E203 aren't stable rules in ruff, so only E501 is ignored
+            cmd = [
+                "ruff", "check", f"{self.main_module}.py",
+                "--line-length=100", "--select=E,W,F", "--ignore=E501",
+                "--output-format=json"
+            ]
+            return self.run_cached_command(
+                cmd, "Code linting (ruff)", summarize=self.summarize_ruff
+            )
+            
+        cmd = [
+            "flake8", f"{self.main_module}.py",
+            "--max-line-length=100", "--ignore=E501,W503,E203"
+        ]
+        return self.run_cached_command(cmd, "Code linting (flake8)")
         
     def run_type_checking(self):
         """Run type checking with mypy."""
-        cmd = f"mypy {self.main_module}.py --ignore-missing-imports --no-strict-optional"
-        return self.run_command(cmd, "Type checking (mypy)", required=False)
+        cmd = [
+            "mypy", f"{self.main_module}.py",
+            "--ignore-missing-imports", "--no-strict-optional",
+            "--incremental", "--cache-dir", ".mypy_cache", "--sqlite-cache"
+        ]
+        
+        try:
+            from mypy import api as mypy_api
+        except ImportError:
+            entry_point = None
+        else:
+            entry_point = mypy_api.run
+            
+        return self.run_cached_command(
+            cmd, "Type checking (mypy)", required=False, entry_point=entry_point
+        )
         
     def run_formatting(self):
         """Run code formatting with black."""
-        cmd = f"black {self.main_module}.py --line-length 100 --check"
+        cmd = ["black", f"{self.main_module}.py", "--line-length", "100", "--check"]
         return self.run_command(cmd, "Code formatting (black)", required=False)
         
     def run_security_check(self):
         """Run security check with bandit."""
-        cmd = f"bandit -r {self.main_module}.py -q"
+        cmd = ["bandit", "-r", f"{self.main_module}.py", "-q"]
         return self.run_command(cmd, "Security check (bandit)", required=False)
         
-    def run_tests(self, quick=False, coverage=False):
-        """Run the test suite."""
-        cmd = "pytest"
+    def xdist_options(self, workers):
+        """pytest options that spread the run over ``workers`` pytest-xdist processes."""
+        if importlib.util.find_spec("xdist") is None:
+            self.print_warning("pytest-xdist not installed, running tests serially")
+            return []
         
-        if quick:
-            cmd += " -m 'not slow'"
-            
-        if coverage:
-            cmd += " --cov=prusa_webcam_uploader --cov-report=html --cov-report=term-missing"
-            
-        if self.verbose:
-            cmd += " -v"
-            
-        return self.run_command(cmd, "Test suite (pytest)")
+        if workers == "auto" and self.cpus:
+            # xdist sizes "auto" by psutil's physical core count, which
+            # ignores the taskset pinning, so size it from the pinned cores
+            workers = len(self.cpus)
+            if self.max_workers:
+                workers = min(workers, self.max_workers)
+                
+        # Keep each test file on one worker so module-scoped fixtures are shared
+        options = ["-n", str(workers), "--dist=loadfile"]
+        if self.max_workers:
+            options.append(f"--maxprocesses={self.max_workers}")
+        return options
+        
+    def run_pytest(self, argv, description):
+        """Run pytest with only the plugins in ``PYTEST_PLUGINS`` that are installed."""
+        plugins = []
+        for package, plugin in self.PYTEST_PLUGINS.items():
+            if importlib.util.find_spec(package) is not None:
+                plugins.extend(["-p", plugin])
+                
+        env = dict(os.environ, PYTEST_DISABLE_PLUGIN_AUTOLOAD="1")
+        return self.run_command([argv[0], *plugins, *argv[1:]], description, env=env)
+        
+    def pytest_flags(self, **options):
+        """pytest arguments for the ``PYTEST_FLAGS`` options that are set in ``options``."""
+        return list(itertools.chain.from_iterable(
+            flags for name, flags in self.PYTEST_FLAGS.items() if options.get(name)
+        ))
+        
+    def run_tests(self, quick=False, coverage=False, full=False, coverage_html=False):
+        """
+        Run the test suite.
+        
+        Quick runs skip slow tests and, unless ``full`` is set or this is a CI
+        run, run the tests that failed last time first and stop at the first
+        failure. Coverage
+        is reported on the terminal; ``coverage_html`` also writes htmlcov/.
+        Runs of the whole suite with coverage enforce the coverage floor.
+        """
+        last_failed = quick and not (full or self.ci)
+        coverage = coverage or coverage_html
+        cmd = [
+            "pytest",
+            *self.xdist_options(self.workers),
+            *self.pytest_flags(
+                last_failed=last_failed,
+                no_cache=not (last_failed or self.ci),
+                quick=quick,
+                coverage=coverage,
+                coverage_floor=coverage and not quick,
+                coverage_html=coverage_html,
+                ci=self.ci,
+                verbose=self.verbose
+            )
+        ]
+        return self.run_pytest(cmd, "Test suite (pytest)")
         
     def run_performance_tests(self, quick=False):
         """Run performance tests."""
-        cmd = "pytest tests/test_performance.py"
+        # Few workers and no coverage tracing, so timings aren't skewed
+        cmd = [
+            "pytest", "tests/test_performance.py",
+            *self.xdist_options(self.perf_workers),
+            *self.pytest_flags(
+                no_cache=not self.ci, quick=quick, ci=self.ci, verbose=self.verbose
+            )
+        ]
+        return self.run_pytest(cmd, "Performance tests")
         
-        if quick:
-            cmd += " -m 'not slow'"
+    def assign_cpus(self, checks):
+        """
+        Split the cores the runner may use between checks running together.
+        
+        The test suite gets its own cores so its xdist workers don't contend
+        with the static checks, which share a core each out of at most half
+        of them. Nothing is pinned with fewer than four cores, without the
+        test suite, or where sched_getaffinity or taskset is unavailable.
+        Checks that run in-process (mypy through its API) are never pinned.
+        
+        Args:
+            checks: ``(method, args)`` pairs as given to run_concurrently
             
-        if self.verbose:
-            cmd += " -v"
+        Returns:
+            A set of core numbers, or None, for each check
+        """
+        runs_tests = any(method is TestRunner.run_tests for method, _ in checks)
+        if not (runs_tests and hasattr(os, "sched_getaffinity") and shutil.which("taskset")):
+            return [None] * len(checks)
+            
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < 4:
+            return [None] * len(checks)
+            
+        shared = cpus[:min(len(checks) - 1, len(cpus) // 2)]
+        static_cpus = itertools.cycle(shared)
+        return [
+            set(cpus[len(shared):]) if method is TestRunner.run_tests else {next(static_cpus)}
+            for method, _ in checks
+        ]
+        
+    def run_concurrently(self, checks):
+        """
+        Run independent checks at the same time.
+        
+        Each check writes its status lines to its own buffer, and the buffers
+        are printed in the order the checks were given once all of them have
+        finished. Live output in verbose mode is labelled with the check name.
+        
+        Args:
+            checks: ``(method, args)`` pairs of TestRunner methods to call
             
-        return self.run_command(cmd, "Performance tests")
+        Returns:
+            True if every check passed
+        """
+        def run(check, cpus):
+            method, args = check
+            worker = copy.copy(self)
+            worker.stream = io.StringIO()
+            worker.label = f"[{method.__name__[len('run_'):]}] "
+            worker.cpus = cpus
+            return method(worker, *args), worker.stream.getvalue()
+        
+        with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+            results = list(pool.map(run, checks, self.assign_cpus(checks)))
+        
+        success = True
+        for passed, output in results:
+            self.stream.write(output)
+            success &= passed
+        return success
         
     def run_all_checks(self, quick=False, coverage=False, lint_only=False, 
-                      type_only=False, perf_only=False):
+                      type_only=False, perf_only=False, full=False, coverage_html=False):
         """Run all quality checks and tests."""
         
-        print(f"{Colors.CYAN}{'='*60}{Colors.NC}")
-        print(f"{Colors.WHITE}🧪 Prusa Connect Webcam Uploader Test Suite{Colors.NC}")
-        print(f"{Colors.CYAN}{'='*60}{Colors.NC}")
+        rule = f"{Colors.CYAN}{'='*60}{Colors.NC}\n"
+        self.stream.write(
+            f"{rule}{Colors.WHITE}🧪 Prusa Connect Webcam Uploader Test Suite{Colors.NC}\n{rule}"
+        )
         
         if not self.check_dependencies():
             return False
             
         success = True
         
-        # Run specific checks based on flags
-        if lint_only:
-            success &= self.run_linting()
-        elif type_only:
-            success &= self.run_type_checking()
-        elif perf_only:
+        # Without an --*-only flag everything but the performance tests runs
+        run_all = not (lint_only or type_only or perf_only)
+        
+        # None of these depends on another's result
+        checks = []
+        if lint_only or run_all:
+            checks.append((TestRunner.run_linting, ()))
+        if type_only or run_all:
+            checks.append((TestRunner.run_type_checking, ()))
+        if run_all:
+            checks.append((TestRunner.run_formatting, ()))
+            checks.append((TestRunner.run_security_check, ()))
+            checks.append((TestRunner.run_tests, (quick, coverage, full, coverage_html)))
+        if checks:
+            success &= self.run_concurrently(checks)
+            
+        # Performance tests run alone so other checks don't skew the timings
+        if perf_only:
             success &= self.run_performance_tests(quick)
-        else:
-            # Run all checks
-            success &= self.run_linting()
-            success &= self.run_type_checking()
-            success &= self.run_formatting()
-            success &= self.run_security_check()
-            success &= self.run_tests(quick, coverage)
             
         # Final result
-        print(f"\n{Colors.CYAN}{'='*60}{Colors.NC}")
+        self.stream.write(f"\n{rule}")
         if success:
             self.print_success("🎉 All checks passed!")
-            if coverage:
+            if coverage_html:
                 self.print_status("📊 Coverage report: htmlcov/index.html")
         else:
             self.print_error("💥 Some checks failed!")
             
         return success
+        
+    def watched_state(self):
+        """Modification times of the main module and the test files."""
+        paths = [self.project_root / f"{self.main_module}.py"]
+        paths.extend((self.project_root / "tests").glob("*.py"))
+        
+        state = {}
+        for path in paths:
+            try:
+                state[path] = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return state
+        
+    def watch(self, interval=1.0, **check_options):
+        """
+        Run the checks, then again each time the main module or a test changes.
+        
+        Changes are found by polling modification times. Each run starts
+        pytest, ruff and flake8 as new processes; only mypy, which runs through
+        its API from the project root, stays loaded between runs. Stops on
+        Ctrl+C.
+        
+        Args:
+            interval: Seconds between polls
+            **check_options: Arguments for run_all_checks
+        """
+        try:
+            while True:
+                state = self.watched_state()
+                self.run_all_checks(**check_options)
+                self.print_status("Watching for changes (Ctrl+C to stop)...")
+                while self.watched_state() == state:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stream.write("\n")
 
 
-def main():
-    """Main entry point."""
+@lru_cache(maxsize=None)
+def build_parser():
+    """Command line parser for the runner, built once per process."""
     parser = argparse.ArgumentParser(
         description="Unified test runner for Prusa Connect Webcam Uploader",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
   python run_tests.py                    # Run all checks
-  python run_tests.py --quick           # Skip slow tests
-  python run_tests.py --coverage        # Generate coverage report
+  python run_tests.py --quick           # Skip slow tests, last failures first
+  python run_tests.py --quick --all     # Skip slow tests, run all the others
+  python run_tests.py --coverage        # Show a coverage report
+  python run_tests.py --coverage-html   # Also write an HTML coverage report
   python run_tests.py --lint-only       # Only run linting
   python run_tests.py --type-only       # Only run type checking
   python run_tests.py --perf-only       # Only run performance tests
+  python run_tests.py -j 4              # Run tests on 4 worker processes
+  python run_tests.py --quick --watch   # Re-run quick tests on every change
         """
     )
     
     parser.add_argument("--quick", "-q", action="store_true", 
-                       help="Skip slow tests")
+                       help="Skip slow tests, run last failures first and stop at the first failure")
+    parser.add_argument("--all", "-a", action="store_true", dest="full",
+                       help="With --quick, run every non-slow test in the usual order")
     parser.add_argument("--coverage", "-c", action="store_true", 
-                       help="Generate coverage report")
+                       help="Show a coverage report in the terminal")
+    parser.add_argument("--coverage-html", action="store_true",
+                       help="Also write an HTML coverage report to htmlcov/")
     parser.add_argument("--lint-only", "-l", action="store_true", 
                        help="Only run linting")
     parser.add_argument("--type-only", "-t", action="store_true", 
@@ -224,18 +671,49 @@ Examples:
                        help="Only run performance tests")
     parser.add_argument("--verbose", "-v", action="store_true", 
                        help="Verbose output")
+    parser.add_argument("--workers", "-j", default="auto",
+                       help="pytest-xdist worker processes for the test suite (default: auto)")
+    parser.add_argument("--perf-workers", default="1",
+                       help="pytest-xdist worker processes for performance tests (default: 1)")
+    parser.add_argument("--max-workers", type=int,
+                       help="Upper limit on worker processes when --workers is auto")
+    parser.add_argument("--watch", "-w", action="store_true",
+                       help="Re-run the checks whenever the code or tests change")
+    parser.add_argument("--ci", action="store_true",
+                       help="Terse pytest output for CI logs (default when CI=true)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Re-run linting and type checking even if the code passed them before")
+    return parser
+
+
+def main(argv=None):
+    """Main entry point."""
+    args = build_parser().parse_args(argv)
     
-    args = parser.parse_args()
-    
-    runner = TestRunner(verbose=args.verbose)
-    success = runner.run_all_checks(
+    runner = TestRunner(
+        verbose=args.verbose,
+        workers=args.workers,
+        perf_workers=args.perf_workers,
+        max_workers=args.max_workers,
+        use_cache=not args.no_cache,
+        ci=args.ci or os.environ.get("CI") == "true"
+    )
+    check_options = dict(
         quick=args.quick,
         coverage=args.coverage,
+        coverage_html=args.coverage_html,
         lint_only=args.lint_only,
         type_only=args.type_only,
-        perf_only=args.perf_only
+        perf_only=args.perf_only,
+        full=args.full
     )
     
+    if args.watch:
+        runner.watch(**check_options)
+        sys.exit(0)
+        
+    success = runner.run_all_checks(**check_options)
+    
     sys.exit(0 if success else 1)
 
 
@@ -0,0 +1,159 @@
+"""
+Shared pytest fixtures for the Prusa Connect Webcam Uploader tests
+"""
+
+import copy
+import logging
+import os
+import sys
+import tempfile
+from dataclasses import replace
+from unittest.mock import Mock, patch
+
+# The heavier test dependencies are imported here, while each xdist worker
+# starts up, rather than by whichever test module happens to need them first.
+# OpenCV is imported in pytest_configure so --fake-cv2 can replace it.
+import numpy as np
+import pytest
+import requests
+import responses  # noqa: F401
+
+from .test_cv2_mock import mock_opencv
+
+# Memory-backed filesystem used for temporary files when available
+_SHM_DIR = '/dev/shm'
+
+# Attribute names the logger and session mocks accept, read off the real
+# classes once rather than on every mock construction
+_LOGGER_SPEC = dir(logging.Logger)
+_SESSION_SPEC = dir(requests.Session)
+
+
+def pytest_addoption(parser):
+    """Register the command line options for the test suite."""
+    parser.addoption(
+        "--fake-cv2",
+        action="store_true",
+        help="run against the OpenCV stand-in instead of importing the real cv2",
+    )
+
+
+def pytest_configure(config):
+    """
+    Keep ``tmp_path`` and other temporary files on tmpfs where available.
+    
+    The file-heavy stress tests then never wait on a block device. An explicit
+    TMPDIR or --basetemp still takes precedence.
+    
+    With ``--fake-cv2``, or when OpenCV cannot be imported, the OpenCV
+    stand-in is installed before any test module is imported, so the suite
+    still runs rather than being skipped.
+    """
+    if config.getoption("--fake-cv2"):
+        sys.modules['cv2'] = mock_opencv()
+    else:
+        try:
+            import cv2  # noqa: F401
+        except ImportError:
+            sys.modules['cv2'] = mock_opencv()
+    
+    if os.environ.get('TMPDIR') or config.option.basetemp:
+        return
+    
+    if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK | os.X_OK):
+        tempfile.tempdir = _SHM_DIR
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _test_credentials():
+    """
+    Set the Prusa Connect credentials every uploader needs for the whole run.
+    
+    Tests that need other values override them with ``monkeypatch``.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("FINGERPRINT", "test_fingerprint")
+        mp.setenv("TOKEN", "test_token")
+        yield
+
+
+def pytest_report_header(config):
+    """Say whether the run uses the real OpenCV or the stand-in."""
+    if isinstance(sys.modules.get('cv2'), Mock):
+        return "cv2: OpenCV stand-in (tests/test_cv2_mock.py)"
+    return None
+
+
+@pytest.fixture
+def fake_cv2(monkeypatch):
+    """
+    Replace OpenCV with a mock for the duration of a test.
+    
+    The mock is installed in ``sys.modules`` and, if the uploader module has
+    already been imported, as its ``cv2`` global.
+    """
+    cv2_mock = mock_opencv()
+    monkeypatch.setitem(sys.modules, 'cv2', cv2_mock)
+    
+    uploader_module = sys.modules.get('prusa_webcam_uploader')
+    if uploader_module is not None:
+        monkeypatch.setattr(uploader_module, 'cv2', cv2_mock)
+    
+    yield cv2_mock
+
+
+@pytest.fixture(scope="session")
+def blank_frame():
+    """
+    A black 640x480 BGR frame, allocated once for the whole run.
+    
+    The array is read-only so no test can change what the others see.
+    """
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame.flags.writeable = False
+    return frame
+
+
+@pytest.fixture(scope="session")
+def uploader_template(_test_credentials):
+    """
+    Uploader built from the default test configuration, once per run.
+    
+    Its environment parsing and validation happen here and nowhere else; tests
+    use ``uploader`` or ``make_uploader``, which hand out copies of this one.
+    """
+    from prusa_webcam_uploader import PrusaWebcamUploader
+    
+    with patch.object(PrusaWebcamUploader, '_setup_logging', return_value=Mock()), \
+         patch.object(PrusaWebcamUploader, '_setup_session', return_value=Mock()):
+        return PrusaWebcamUploader()
+
+
+@pytest.fixture
+def make_uploader(uploader_template):
+    """
+    Factory for uploaders that skips ``__init__``.
+    
+    Each call copies the template, gives it its own mock logger and session,
+    and applies any keyword arguments as config overrides. The state derived
+    from the config is rebuilt for every copy, so overrides take effect and
+    no mutable headers or encoder parameters are shared. The mocks only
+    accept attributes the real ``Logger`` and ``Session`` have, so a typo in a
+    test fails instead of passing silently.
+    """
+    def make(**config_overrides):
+        uploader = copy.copy(uploader_template)
+        uploader.logger = Mock(spec=_LOGGER_SPEC)
+        uploader.session = Mock(spec=_SESSION_SPEC)
+        if config_overrides:
+            uploader.config = replace(uploader.config, **config_overrides)
+        uploader._apply_config()
+        return uploader
+    
+    return make
+
+
+@pytest.fixture
+def uploader(make_uploader):
+    """An uploader with the default test configuration."""
+    return make_uploader()
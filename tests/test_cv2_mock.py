@@ -1,24 +1,32 @@
 #!/usr/bin/env python3
 """
-Test configuration and utilities for handling OpenCV dependencies gracefully
+OpenCV stand-in for tests that should not depend on a real capture backend
+
+Importing this module has no side effects; tests that want the stand-in
+request the ``fake_cv2`` fixture from ``conftest.py``.
 """
 
-import sys
 from unittest.mock import Mock
 
-# Mock OpenCV if it's not available (useful for testing environments)
+
 def mock_opencv():
-    """Mock OpenCV module for testing environments where it's not available."""
+    """Build a mock OpenCV module with the attributes the uploader uses."""
     cv2_mock = Mock()
     
     # Mock common OpenCV constants
     cv2_mock.CAP_PROP_BUFFERSIZE = 38
+    cv2_mock.CAP_PROP_FORMAT = 8
+    cv2_mock.CAP_FFMPEG = 1900
     cv2_mock.IMWRITE_JPEG_QUALITY = 1
+    cv2_mock.IMWRITE_JPEG_PROGRESSIVE = 2
+    cv2_mock.IMWRITE_JPEG_OPTIMIZE = 3
     
     # Mock VideoCapture class
     video_capture_mock = Mock()
     video_capture_mock.isOpened.return_value = True
     video_capture_mock.read.return_value = (True, Mock())
+    video_capture_mock.grab.return_value = True
+    video_capture_mock.retrieve.return_value = (True, Mock())
     video_capture_mock.set.return_value = True
     video_capture_mock.release.return_value = None
     
@@ -28,13 +36,5 @@ def mock_opencv():
     
     return cv2_mock
 
-# Try to import cv2, fall back to mock if not available
-try:
-    import cv2
-except ImportError:
-    print("OpenCV not available, using mock for testing", file=sys.stderr)
-    cv2 = mock_opencv()
-    sys.modules['cv2'] = cv2
 
-# Make cv2 available for import in tests
-__all__ = ['cv2']
+__all__ = ['mock_opencv']